@@ -1,36 +1,37 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
+from pydantic import BaseModel
 from sync import Sync
 from sync.common import Audio, Video, GenerationOptions
 from sync.core.api_error import ApiError
-import os, uuid, time, requests, cloudinary, cloudinary.uploader
-from tqdm import tqdm
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import os, time, json, random, logging, functools, hmac, hashlib, asyncio, httpx, redis, cloudinary, cloudinary.api, cloudinary.uploader
+from redis import asyncio as aioredis
+from celery import Celery, states, uuid
+from celery.signals import task_postrun
+from celery.result import AsyncResult
 from dotenv import load_dotenv
-from starlette.status import HTTP_202_ACCEPTED # Not used in this version, but kept for context
+from starlette.status import HTTP_202_ACCEPTED, HTTP_413_CONTENT_TOO_LARGE, HTTP_415_UNSUPPORTED_MEDIA_TYPE
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
 
 # ------------------- Load Environment -------------------
 load_dotenv()
 
-app = FastAPI(title="Sync.so Lip-Sync API")
-
-# --- CORS Middleware (ALLOWS FRONTEND TO CONNECT) ---
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Uvicorn only configures its own loggers, so set up the root logger for ours (LOG_LEVEL overrides)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
 )
+logging.getLogger("httpx").setLevel(logging.WARNING)  # One INFO line per Sync.so poll is noise
+logger = logging.getLogger(__name__)
 
 # Sync API Key
 API_KEY = os.getenv("SYNC_API_KEY")
 if not API_KEY:
     raise RuntimeError("Missing SYNC_API_KEY in environment variables")
 
-# Initialize Sync client
-client = Sync(base_url="https://api.sync.so", api_key=API_KEY).generations
-
 # Cloudinary Setup
 CLOUDINARY_URL = os.getenv("CLOUDINARY_URL")
 if not CLOUDINARY_URL:
@@ -38,93 +39,516 @@ if not CLOUDINARY_URL:
 
 cloudinary.config(cloudinary_url=CLOUDINARY_URL)
 
-# Local folder (for temp save)
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Celery Setup (Redis is both the broker and the result backend)
+# Run a worker with: celery -A app.main.celery_app worker
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+celery_app = Celery("lipsync", broker=REDIS_URL, backend=REDIS_URL)
+redis_client = redis.Redis.from_url(REDIS_URL)
+
+# Sync.so webhook (optional): set PUBLIC_BASE_URL and SYNC_WEBHOOK_SECRET so Sync.so
+# can call us back instead of being polled; unsigned webhooks are never accepted
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL")
+WEBHOOK_SECRET = os.getenv("SYNC_WEBHOOK_SECRET")
+if PUBLIC_BASE_URL and not WEBHOOK_SECRET:
+    logger.warning("PUBLIC_BASE_URL is set but SYNC_WEBHOOK_SECRET is not; falling back to polling")
+WEBHOOK_URL = f"{PUBLIC_BASE_URL.rstrip('/')}/webhook/sync" if PUBLIC_BASE_URL and WEBHOOK_SECRET else None
+WEBHOOK_SIGNATURE_HEADER = "X-Sync-Signature"
+WEBHOOK_FALLBACK_SECONDS = 60  # Poll Sync.so if the webhook stays silent this long
+POLL_AFTER_SECONDS = 10  # Hint for clients polling /status
+LONG_POLL_MAX_SECONDS = 25  # Upper bound for /status?wait=
+RESULT_CACHE_SECONDS = 86400  # Reuse the output for identical audio + video for a day
+
+# Cloudinary janitor: uploaded job audio is tagged so leftovers can be swept periodically
+AUDIO_TAG = "lipsync_audio"
+AUDIO_MAX_AGE_SECONDS = 3600  # Older audio is swept once its job has finished
+AUDIO_HARD_MAX_AGE_SECONDS = 86400  # Swept regardless, e.g. when the job was never enqueued
+JANITOR_INTERVAL_SECONDS = 300
+
+# Upload limits, checked before anything is sent to Cloudinary
+MAX_AUDIO_BYTES = 50 * 1024 * 1024
+MAX_UPLOAD_REQUEST_BYTES = MAX_AUDIO_BYTES + 1024 * 1024  # Room for multipart headers/boundaries
+ALLOWED_AUDIO_TYPES = {"audio/mpeg", "audio/wav", "audio/x-wav", "audio/wave", "audio/mp4", "audio/x-m4a"}
 
-# Predefined videos
-PREDEFINED_VIDEOS = {
+# Predefined videos (mirrored to Cloudinary on startup, see warm_predefined_videos)
+PREDEFINED_VIDEO_SOURCES = {
     "video1": "https://drive.google.com/uc?export=download&id=1zEQnsgkUrFHGZDRzFPmxYXm0qKNREDFI"
 }
+PREDEFINED_VIDEOS = dict(PREDEFINED_VIDEO_SOURCES)  # Served URLs, swapped for Cloudinary copies
+PREDEFINED_VIDEOS_CACHE_KEY = "lipsync:predefined_videos"  # source URL -> Cloudinary URL
+PREDEFINED_VIDEOS_LOCK_KEY = "lipsync:predefined_videos:lock"
+PREDEFINED_VIDEOS_LOCK_SECONDS = 300  # Only one server worker verifies/mirrors per window
+PREDEFINED_VIDEOS_RETRY_SECONDS = 5  # First re-check delay while mirrors are missing, doubles up to the lock window
 
-# ------------------- Main Endpoint -------------------
-@app.post("/generate-lipsync/")
-async def generate_lipsync(
-    audio: UploadFile = File(...),
-    video_choice: str = Query("video1", description="Choose predefined video")
-):
-    if video_choice not in PREDEFINED_VIDEOS:
-        raise HTTPException(status_code=400, detail="Invalid video choice")
+TERMINAL_STATUSES = ["COMPLETED", "FAILED", "REJECTED"]
 
-    video_url = PREDEFINED_VIDEOS[video_choice]
-    audio_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{audio.filename}")
-    
-    # Initialize variables for cleanup
-    audio_file_saved = False 
+# Polling backoff: start fast for short jobs, back off to spare the Sync.so quota on long ones
+POLL_INITIAL_DELAY = 1.0
+POLL_PROCESSING_DELAY = 0.5  # Backoff restarts here once Sync.so starts processing
+POLL_MAX_DELAY = 15.0
+POLL_BACKOFF_FACTOR = 1.5
 
-    try:
-        # Save audio locally
-        with open(audio_path, "wb") as f:
-            f.write(await audio.read())
-        audio_file_saved = True # Mark that the file exists for cleanup
+def webhook_key(generation_id: str) -> str:
+    return f"lipsync:webhook:{generation_id}"
+
+def events_channel(task_id: str) -> str:
+    return f"lipsync:events:{task_id}"
+
+def result_cache_key(audio_digest: str, video_choice: str) -> str:
+    return f"lipsync:result:{audio_digest}:{video_choice}"
+
+# ------------------- Response Models -------------------
+class JobStatus(BaseModel):
+    status: str
+    video_url: Optional[str] = None
+    error: Optional[str] = None
+    poll_after_seconds: Optional[int] = None
+
+
+class Job(JobStatus):
+    job_id: str
+    poll_url: str
+    poll_interval_seconds: int
+
+
+class WebhookAck(BaseModel):
+    received: bool
+
+# ------------------- Helpers -------------------
+@functools.cache
+def get_sync_client():
+    """Build the Sync.so client on first use, so only Celery workers create it."""
+    # Shared HTTP connection pool (keep-alive + retry on connection errors) for Sync.so calls
+    # (limits go on the transport: httpx.Client ignores limits= when a transport is passed)
+    http_client = httpx.Client(
+        transport=httpx.HTTPTransport(
+            retries=3,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        ),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    )
+    return Sync(base_url="https://api.sync.so", api_key=API_KEY, httpx_client=http_client).generations
+
+def hash_audio(audio: UploadFile) -> str:
+    """Return the SHA-256 hex digest of the uploaded audio and rewind it.
+
+    Blocking (file reads and hashing), so run it with asyncio.to_thread. Raises a 413
+    if the audio exceeds MAX_AUDIO_BYTES; grossly oversized request bodies are already
+    cut off by UploadSizeLimitMiddleware.
+    """
+    if audio.size is not None and audio.size > MAX_AUDIO_BYTES:
+        raise HTTPException(status_code=HTTP_413_CONTENT_TOO_LARGE, detail="File too large")
+
+    digest = hashlib.sha256()
+    audio.file.seek(0)
+    while chunk := audio.file.read(1 << 20):
+        digest.update(chunk)
+    audio.file.seek(0)
+    return digest.hexdigest()
+
+async def upload_audio(audio: UploadFile, job_id: str) -> dict:
+    """Stream the uploaded audio to Cloudinary and return the upload result."""
+    # upload_large reads the spooled upload in chunks, so the audio is never
+    # copied into memory or re-written to a local file first; it runs in a
+    # worker thread because the Cloudinary SDK is blocking
+    upload_result = await asyncio.to_thread(
+        cloudinary.uploader.upload_large,
+        audio.file,
+        resource_type="video",
+        filename=audio.filename,
+        tags=[AUDIO_TAG],
+        context={"job_id": job_id},  # Lets cleanup_stale_audio skip audio of in-flight jobs
+        chunk_size=6_000_000,
+    )
+    logger.info("Uploaded audio to Cloudinary: %s", upload_result["secure_url"])
+    return upload_result
 
-        # Upload audio to Cloudinary (get public URL)
-        upload_result = cloudinary.uploader.upload(audio_path, resource_type="video")
-        public_audio_url = upload_result["secure_url"]
+def poll_delays(initial: float = POLL_INITIAL_DELAY):
+    """Yield jittered, exponentially growing delays between Sync.so status polls."""
+    delay = initial
+    while True:
+        yield delay + random.uniform(0, 0.25 * delay)
+        delay = min(delay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY)
 
-        print(f"🎵 Uploaded audio to Cloudinary: {public_audio_url}")
+def read_job(job_id: str) -> JobStatus:
+    """Read a job's state from the Celery result backend (blocking, run it in a thread)."""
+    result = AsyncResult(job_id, app=celery_app)
+    state = result.state
 
-        # Start Sync.so generation
+    if state == states.SUCCESS:
+        return JobStatus(status=state, video_url=result.result["video_url"])
+    if state in states.PROPAGATE_STATES:
+        return JobStatus(status=state, error=str(result.result))
+    return JobStatus(status=state, poll_after_seconds=POLL_AFTER_SECONDS)
+
+def is_cloudinary_url(url: str) -> bool:
+    return httpx.URL(url).host == "res.cloudinary.com"
+
+async def mirror_predefined_videos(http: httpx.AsyncClient, async_redis: aioredis.Redis) -> bool:
+    """Verify each predefined video and mirror it to Cloudinary; return True if all are mirrored."""
+    mirrored_all = True
+
+    for key, source_url in PREDEFINED_VIDEO_SOURCES.items():
+        url = PREDEFINED_VIDEOS[key]
+        try:
+            head = await http.head(url, follow_redirects=True)
+            if head.is_error or not is_cloudinary_url(str(head.url)):
+                # Let Cloudinary fetch the source once; restarts reuse the cached mapping
+                upload_result = await asyncio.to_thread(
+                    cloudinary.uploader.upload,
+                    source_url,
+                    resource_type="video",
+                    public_id=f"predef_{key}",
+                    overwrite=False,
+                )
+                url = upload_result["secure_url"]
+                await async_redis.hset(PREDEFINED_VIDEOS_CACHE_KEY, source_url, url)
+                logger.info("Mirrored predefined video %s to Cloudinary: %s", key, url)
+
+            PREDEFINED_VIDEOS[key] = url
+
+        except Exception as e:
+            # Keep serving the original URL; Sync.so can still fetch it
+            logger.warning("Could not warm predefined video %s: %s", key, e)
+            mirrored_all = False
+
+    return mirrored_all
+
+async def warm_predefined_videos(http: httpx.AsyncClient, async_redis: aioredis.Redis):
+    """Point every predefined video at a Cloudinary copy so Sync.so fetches it directly.
+
+    Runs in the background after startup; requests use the original URLs until it finishes.
+    One server worker at a time holds the lock and mirrors; the others keep re-reading the
+    shared mapping until every video is mirrored, and take over the lock if a mirror fails.
+    """
+    delay = PREDEFINED_VIDEOS_RETRY_SECONDS
+
+    while True:
+        try:
+            cached = await async_redis.hgetall(PREDEFINED_VIDEOS_CACHE_KEY)
+            for key, source_url in PREDEFINED_VIDEO_SOURCES.items():
+                if source_url in cached:
+                    PREDEFINED_VIDEOS[key] = cached[source_url]
+
+            if await async_redis.set(PREDEFINED_VIDEOS_LOCK_KEY, os.getpid(), nx=True, ex=PREDEFINED_VIDEOS_LOCK_SECONDS):
+                if await mirror_predefined_videos(http, async_redis):
+                    # Keep the lock until it expires so restarts within the window skip re-verifying
+                    return
+                # Release it so the next attempt, from any worker, retries the failed mirrors
+                await async_redis.delete(PREDEFINED_VIDEOS_LOCK_KEY)
+
+            elif all(source_url in cached for source_url in PREDEFINED_VIDEO_SOURCES.values()):
+                return
+
+        except Exception as e:
+            # Keep serving the current URLs; Sync.so can still fetch them
+            logger.warning("Could not warm predefined videos: %s", e)
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, PREDEFINED_VIDEOS_LOCK_SECONDS)
+
+# ------------------- Background Task -------------------
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def run_lipsync(self, audio_url: str, video_url: str, cache_key: str) -> dict:
+    """Run a Sync.so generation to completion and return the output video URL."""
+    client = get_sync_client()
+    create_options = {"webhook_url": WEBHOOK_URL} if WEBHOOK_URL else {}
+
+    try:
         response = client.create(
-            input=[Video(url=video_url), Audio(url=public_audio_url)],
+            input=[Video(url=video_url), Audio(url=audio_url)],
             model="lipsync-2",
-            options=GenerationOptions(sync_mode="cut_off")
+            options=GenerationOptions(sync_mode="cut_off"),
+            **create_options
         )
 
         job_id = response.id
-        status = "PENDING"
-        progress_bar = tqdm(total=100, desc="Processing", position=0)
-        progress_increment = 5  # Simple time-based increment
+        generation = response
+        status = generation.status
 
-        # Polling Loop (Synchronous)
-        while status not in ["COMPLETED", "FAILED", "REJECTED"]:
-            time.sleep(5)
+        # Wait Loop (runs in the worker, so blocking here is fine)
+        delays = poll_delays()
+        while status not in TERMINAL_STATUSES:
+            if WEBHOOK_URL:
+                # Block until the webhook fires; only poll Sync.so if it stays silent
+                redis_client.blpop(webhook_key(job_id), timeout=WEBHOOK_FALLBACK_SECONDS)
+            else:
+                time.sleep(next(delays))
             generation = client.get(job_id)
+            if generation.status != status:
+                logger.info("job %s status=%s", job_id, generation.status)
+                if generation.status == "PROCESSING":
+                    # Queue wait is over; short clips finish soon after, so restart the backoff low
+                    delays = poll_delays(POLL_PROCESSING_DELAY)
+                if generation.status not in TERMINAL_STATUSES:
+                    # Expose the Sync.so status to /status and wake any long-polls;
+                    # the final state is published by publish_final_state
+                    self.update_state(state=generation.status)
+                    redis_client.publish(events_channel(self.request.id), generation.status)
             status = generation.status
-            
-            # ------------------- FIX FOR AttributeError: 'Generation' object has no attribute 'progress' -------------------
-            if status == "PROCESSING" and progress_bar.n < 90:
-                progress_bar.update(progress_increment)
-            elif status in ["COMPLETED", "FAILED", "REJECTED"]:
-                # Ensure the bar is complete when the job is done
-                progress_bar.n = 100 
-                
-            progress_bar.set_postfix_str(f"Status: {status}")
-
-        progress_bar.close()
-
-        if status == "COMPLETED":
-            return JSONResponse(
-                content={
-                    "message": "Lipsync generation completed successfully.",
-                    "video_url": generation.output_url
-                }
-            )
-        else:
-            # Handle FAILED or REJECTED status
-            error_detail = generation.error_message if generation.error_message else "Generation failed without a specific message."
-            raise HTTPException(status_code=500, detail=f"Generation failed. Status: {status}. Detail: {error_detail}")
 
     except ApiError as e:
-        # Sync.so API errors (e.g., 400 Bad Request)
-        raise HTTPException(status_code=e.status_code, detail=e.body)
-    
+        # Re-raise as a plain exception so the result backend can serialize it
+        raise RuntimeError(f"Sync.so API error ({e.status_code}): {e.body}")
+
+    if status != "COMPLETED":
+        error_detail = generation.error or "Generation failed without a specific message."
+        raise RuntimeError(f"Generation failed. Status: {status}. Detail: {error_detail}")
+
+    logger.info("job %s completed: %s", job_id, generation.output_url)
+    redis_client.setex(cache_key, RESULT_CACHE_SECONDS, generation.output_url)
+    return {"video_url": generation.output_url}
+
+
+@task_postrun.connect
+def publish_final_state(sender=None, task_id: str = None, state: str = None, **kwargs) -> None:
+    """Wake long-polls once the result is stored, so they read SUCCESS/FAILURE."""
+    if sender is not None and sender.name == run_lipsync.name:
+        redis_client.publish(events_channel(task_id), state)
+
+
+@celery_app.task(ignore_result=True)
+def delete_audio(public_id: str) -> None:
+    """Remove a job's audio from Cloudinary once Sync.so no longer needs it."""
+    cloudinary.uploader.destroy(public_id, resource_type="video")
+
+
+@celery_app.task(ignore_result=True)
+def cleanup_stale_audio() -> None:
+    """Delete job audio left on Cloudinary by jobs that never reached delete_audio."""
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=AUDIO_MAX_AGE_SECONDS)
+    hard_cutoff = now - timedelta(seconds=AUDIO_HARD_MAX_AGE_SECONDS)
+    stale = []
+    page_options = {}
+    done = False
+
+    # Walk oldest first and stop at the first upload newer than the cutoff
+    while not done:
+        page = cloudinary.api.resources_by_tag(
+            AUDIO_TAG,
+            resource_type="video",
+            direction="asc",
+            context=True,
+            max_results=500,
+            **page_options
+        )
+        for resource in page["resources"]:
+            created_at = datetime.fromisoformat(resource["created_at"].replace("Z", "+00:00"))
+            if created_at >= cutoff:
+                done = True
+                break
+            # A job can sit in the queue for a long time before Sync.so fetches its audio
+            job_id = resource.get("context", {}).get("custom", {}).get("job_id")
+            if job_id and created_at >= hard_cutoff and not AsyncResult(job_id, app=celery_app).ready():
+                continue
+            stale.append(resource["public_id"])
+
+        if not page.get("next_cursor"):
+            done = True
+        page_options = {"next_cursor": page.get("next_cursor")}
+
+    # delete_resources accepts at most 100 public ids per call
+    for i in range(0, len(stale), 100):
+        cloudinary.api.delete_resources(stale[i:i + 100], resource_type="video")
+
+    if stale:
+        logger.info("Deleted %d stale audio uploads from Cloudinary", len(stale))
+
+
+# Run the scheduler with: celery -A app.main.celery_app beat
+celery_app.conf.beat_schedule = {
+    "cleanup-stale-audio": {
+        "task": cleanup_stale_audio.name,
+        "schedule": JANITOR_INTERVAL_SECONDS,
+    },
+}
+
+# ------------------- Middleware -------------------
+class UploadSizeLimitMiddleware:
+    """Reject oversized POST /generate bodies before Starlette spools them to disk."""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != "/generate":
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse({"detail": "File too large"}, status_code=HTTP_413_CONTENT_TOO_LARGE)
+            return await response(scope, receive, send)
+
+        # Chunked bodies carry no Content-Length, so count what actually arrives; FastAPI
+        # re-raises an HTTPException from body parsing, so this aborts the upload with a 413
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=HTTP_413_CONTENT_TOO_LARGE, detail="File too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# ------------------- App -------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Async clients are bound to the server's event loop, so build them here and close on shutdown
+    app.state.http = httpx.AsyncClient(
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    )
+    app.state.redis = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+    # Warm up in the background so startup never waits on Redis, Google Drive or Cloudinary
+    warmup = asyncio.create_task(warm_predefined_videos(app.state.http, app.state.redis))
+    yield
+
+    warmup.cancel()
+    await app.state.http.aclose()
+    await app.state.redis.aclose()
+
+
+app = FastAPI(title="Sync.so Lip-Sync API", lifespan=lifespan)
+
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_REQUEST_BYTES)
+
+# --- CORS Middleware (ALLOWS FRONTEND TO CONNECT) ---
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# ------------------- Job Endpoints -------------------
+@app.post("/generate", status_code=HTTP_202_ACCEPTED, response_model_exclude_none=True)
+async def start_generation(
+    request: Request,
+    audio: UploadFile = File(...),
+    video_choice: str = Query("video1", description="Choose predefined video")
+) -> Job:
+    if video_choice not in PREDEFINED_VIDEOS:
+        raise HTTPException(status_code=400, detail="Invalid video choice")
+
+    if audio.content_type not in ALLOWED_AUDIO_TYPES:
+        raise HTTPException(status_code=HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=f"Unsupported audio type: {audio.content_type}")
+
+    video_url = PREDEFINED_VIDEOS[video_choice]
+
+    job_id = uuid()
+    job = dict(job_id=job_id, poll_url=f"/status/{job_id}", poll_interval_seconds=POLL_AFTER_SECONDS)
+
+    # Identical audio for the same video was generated recently: skip Cloudinary and Sync.so,
+    # but still hand out a job that /status resolves, so clients keep a single code path
+    cache_key = result_cache_key(await asyncio.to_thread(hash_audio, audio), video_choice)
+    try:
+        cached_video_url = await request.app.state.redis.get(cache_key)
     except Exception as e:
-        # General unexpected errors (e.g., network, file system, or a misattributed variable)
-        print(f"An unexpected error occurred: {e}")
+        # The cache is an optimisation; treat an unreachable Redis as a miss
+        logger.warning("Could not read result cache: %s", e)
+        cached_video_url = None
+
+    if cached_video_url:
+        await asyncio.to_thread(celery_app.backend.store_result, job_id, {"video_url": cached_video_url}, states.SUCCESS)
+        return Job(**job, status=states.SUCCESS, video_url=cached_video_url)
+
+    try:
+        upload_result = await upload_audio(audio, job_id)
+    except Exception as e:
+        logger.exception("An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An unexpected server error occurred: {e}")
 
-    finally:
-        # Clean up the locally saved audio file only if it was actually saved
-        if audio_file_saved and os.path.exists(audio_path):
-            os.remove(audio_path)
+    # Delete the uploaded audio in a follow-up task once the job finishes either way
+    cleanup = delete_audio.si(upload_result["public_id"])
+    try:
+        await asyncio.to_thread(
+            run_lipsync.apply_async,
+            (upload_result["secure_url"], video_url, cache_key),
+            task_id=job_id,
+            link=cleanup,
+            link_error=cleanup,
+        )
+    except Exception as e:
+        # The uploaded audio is swept later by cleanup_stale_audio
+        logger.exception("Could not enqueue lipsync job: %s", e)
+        raise HTTPException(status_code=503, detail="Job queue unavailable, please retry later")
+    return Job(**job, status=states.PENDING)
+
+
+@app.get("/status/{job_id}", response_model_exclude_none=True)
+async def get_status(
+    request: Request,
+    job_id: str,
+    wait: int = Query(0, ge=0, le=LONG_POLL_MAX_SECONDS, description="Seconds to wait for a status change")
+) -> JobStatus:
+    # Celery's result backend is synchronous, so every read goes through a worker thread
+    job = await asyncio.to_thread(read_job, job_id)
+    if not wait or job.status in states.READY_STATES:
+        return job
+
+    # Long-poll: hold the request until the worker publishes a transition or `wait` runs out
+    async with request.app.state.redis.pubsub() as pubsub:
+        await pubsub.subscribe(events_channel(job_id))
+
+        # Re-read after subscribing so a transition in between is not missed
+        subscribed_job = await asyncio.to_thread(read_job, job_id)
+        if subscribed_job.status != job.status:
+            return subscribed_job
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while (remaining := deadline - loop.time()) > 0:
+            if await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining):
+                break
+
+    return await asyncio.to_thread(read_job, job_id)
+
+
+@app.post("/webhook/sync")
+async def sync_webhook(request: Request) -> WebhookAck:
+    if not WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="Webhooks are not enabled")
+
+    body = await request.body()
+    expected = hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    signature = request.headers.get(WEBHOOK_SIGNATURE_HEADER, "")
+    if not hmac.compare_digest(expected, signature):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    try:
+        generation_id = json.loads(body)["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Malformed webhook payload")
+    if not isinstance(generation_id, str) or not generation_id:
+        raise HTTPException(status_code=400, detail="Malformed webhook payload")
+
+    # Wake up the worker waiting on this generation; it re-reads the
+    # authoritative result from Sync.so, so a forged payload cannot inject a URL
+    key = webhook_key(generation_id)
+    await request.app.state.redis.rpush(key, body)
+    await request.app.state.redis.expire(key, 3600)
+    return WebhookAck(received=True)
+
+
+# ------------------- Server -------------------
+# Run with: python -m app.main (WEB_CONCURRENCY overrides the worker count)
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1)),
+        loop="uvloop",
+        http="httptools",
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+    )